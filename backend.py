@@ -3,14 +3,36 @@
 # This backend acts as a simple socket client, sending the data from the
 # user and returning the data from the server.
 
-from binascii import hexlify
-import queue
+import codecs
+import select
 import selectors
 import socket
-import string
 import threading
 import time
 
+# Longest unterminated line held back before it is flushed as complete.
+MAX_PARTIAL = 4096
+
+
+def _from_epoll(events):
+    """Convert an epoll event mask to a selectors event mask."""
+    mask = 0
+    if events & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+        mask |= selectors.EVENT_READ
+    if events & select.EPOLLOUT:
+        mask |= selectors.EVENT_WRITE
+    return mask
+
+
+def _to_epoll(events):
+    """Convert a selectors event mask to an epoll event mask."""
+    mask = 0
+    if events & selectors.EVENT_READ:
+        mask |= select.EPOLLIN
+    if events & selectors.EVENT_WRITE:
+        mask |= select.EPOLLOUT
+    return mask
+
 
 class Backend(threading.Thread):
     """Backend handler."""
@@ -22,8 +44,30 @@ class Backend(threading.Thread):
         self.port = port
         self.input_queue = input_queue
         self.output_queue = output_queue
-        self.selector = selectors.DefaultSelector()
+        # Use epoll directly where available, falling back to selectors.
+        if hasattr(select, "epoll"):
+            self._epoll = select.epoll()
+            self.selector = None
+        else:
+            self._epoll = None
+            self.selector = selectors.DefaultSelector()
+        self._handlers = dict()
+        self._interest = dict()
+        self._sock = None
+        self._line_tail = list()
+        self._tail_len = 0
+        # Incremental, so a character split across receives stays intact.
+        self._decoder = codecs.getincrementaldecoder("utf-8")(
+            errors="backslashreplace"
+        )
+        # Written to by notify() to wake the backend from its poll.
+        (self._wake_r, self._wake_w) = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
         self.running = False
+        self._recv_buf = bytearray(65536)
+        self._recv_mv = memoryview(self._recv_buf)
+        self._pending = bytearray()
 
     def _connect(self):
         """Connect to the echo server."""
@@ -32,55 +76,156 @@ class Backend(threading.Thread):
             sock.settimeout(3)
             sock.connect((self.addr, self.port))
             sock.setblocking(False)
-            self.selector.register(
-                sock,
-                selectors.EVENT_READ | selectors.EVENT_WRITE,
-                self._handle_io
-            )
+            self._register(sock, selectors.EVENT_READ, self._handle_io)
+            self._sock = sock
             return True
         except (socket.gaierror, socket.timeout, ConnectionRefusedError):
+            sock.close()
             return False
 
     def _handle_io(self, sock, mask):
         """Handle input and output."""
         if mask & selectors.EVENT_WRITE:
-            # Handle input from the user.
-            try:
+            # Handle input from the user. As the only consumer, the backend
+            # can trust empty() to stay False until it takes the item.
+            while self.running and not self.input_queue.empty():
                 input = self.input_queue.get_nowait()
                 if input == ';quit':
                     self.running = False
                 else:
-                    sock.send(f"{input[:998]}\r\n".encode())
-            except queue.Empty:
-                pass
+                    self._pending.extend(f"{input[:998]}\r\n".encode())
+            # Send what the socket will take; keep the rest for later.
+            while self._pending:
+                try:
+                    with memoryview(self._pending) as view:
+                        sent = sock.send(view)
+                except BlockingIOError:
+                    break
+                del self._pending[:sent]
+            if not self._pending:
+                self._modify(sock, selectors.EVENT_READ)
         if mask & selectors.EVENT_READ:
             # Handle output from the server.
-            data = sock.recv(4096)
-            if not data:
-                self.running = False
-            else:
+            received = bytearray()
+            size = None
+            while True:
                 try:
-                    data = data.decode()
-                except UnicodeDecodeError:
-                    output = str()
-                    for byte in data:
-                        output += (
-                            chr(byte)
-                            if byte in [ord(char) for char in string.printable]
-                            else "\\x" + hexlify(bytes([byte])).decode()
-                        )
-                    data = output
-                for line in data.split('\n'):
-                    self.output_queue.put(line)
+                    size = sock.recv_into(self._recv_mv)
+                except BlockingIOError:
+                    break
+                received.extend(self._recv_mv[:size])
+                if size < len(self._recv_buf):
+                    break
+            if size == 0:
+                self.running = False
+            if received:
+                data = self._decoder.decode(received)
+                self.output_queue.put(self._split_lines(data))
         if not self.running:
-            self.selector.unregister(sock)
+            self._unregister(sock)
+
+    def _split_lines(self, data):
+        """Return (complete lines, partial last line) for the new data."""
+        (first, *rest) = data.split('\n')
+        self._line_tail.append(first)
+        self._tail_len += len(first)
+        lines = list()
+        if rest:
+            lines.append("".join(self._line_tail))
+            lines.extend(rest[:-1])
+            self._line_tail = [rest[-1]]
+            self._tail_len = len(rest[-1])
+        if self._tail_len > MAX_PARTIAL:
+            lines.append("".join(self._line_tail))
+            self._line_tail.clear()
+            self._tail_len = 0
+        return (lines, "".join(self._line_tail))
+
+    def _handle_wake(self, sock, mask):
+        """Watch for writability once input has been queued."""
+        try:
+            while sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        if (
+            self.running
+            and self._interest[self._sock.fileno()] != events
+            and not self.input_queue.empty()
+        ):
+            self._modify(self._sock, events)
+        return mask
+
+    def _modify(self, fileobj, events):
+        """Change the events watched on a registered file object."""
+        if self._epoll:
+            self._epoll.modify(fileobj.fileno(), _to_epoll(events))
+        else:
+            (_, callback) = self._handlers[fileobj.fileno()]
+            self.selector.modify(fileobj, events, callback)
+        self._interest[fileobj.fileno()] = events
+
+    def _poll(self, timeout):
+        """Return (fileobj, callback, mask) for each ready file object."""
+        if not self._epoll:
+            return [
+                (key.fileobj, key.data, mask)
+                for key, mask in self.selector.select(timeout)
+            ]
+        ready = list()
+        for fd, events in self._epoll.poll(timeout):
+            handler = self._handlers.get(fd)
+            if handler:
+                ready.append((*handler, _from_epoll(events)))
+        return ready
+
+    def _register(self, fileobj, events, callback):
+        """Watch a file object and call back when it is ready."""
+        if self._epoll:
+            self._epoll.register(fileobj.fileno(), _to_epoll(events))
+        else:
+            self.selector.register(fileobj, events, callback)
+        self._handlers[fileobj.fileno()] = (fileobj, callback)
+        self._interest[fileobj.fileno()] = events
+
+    def _unregister(self, fileobj):
+        """Stop watching a file object."""
+        if self._epoll:
+            self._epoll.unregister(fileobj.fileno())
+        else:
+            self.selector.unregister(fileobj)
+        del self._handlers[fileobj.fileno()]
+        del self._interest[fileobj.fileno()]
+
+    def notify(self):
+        """Wake the backend after new input has been queued."""
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            # Either a wakeup is already pending or the backend has stopped.
+            pass
 
     def run(self):
         """Start the Backend handler."""
         self.running = self._connect()
+        if self.running:
+            self._register(
+                self._wake_r, selectors.EVENT_READ, self._handle_wake
+            )
+            self.notify()
         while self.running:
-            events = self.selector.select()
-            for key, mask in events:
-                callback = key.data
-                callback(key.fileobj, mask)
-        self.output_queue.put(';quit')
+            for (fileobj, callback, mask) in self._poll(None):
+                callback(fileobj, mask)
+        if self._epoll:
+            self._epoll.close()
+        else:
+            self.selector.close()
+        if self._sock:
+            self._sock.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        self._line_tail.append(self._decoder.decode(b"", final=True))
+        if self._tail_len or self._line_tail[-1]:
+            self.output_queue.put((["".join(self._line_tail)], ""))
+        self.output_queue.put(("quit",))
@@ -21,7 +21,9 @@ if __name__ == "__main__":
     socket_client = Backend(
         input_queue, output_queue, args.addr, args.port
     )
+    iface.set_notify(socket_client.notify)
     socket_client.start()
     iface.launch()
     input_queue.put(";quit")
+    socket_client.notify()
     socket_client.join()
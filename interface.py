@@ -1,20 +1,23 @@
 """Curses-based user interface."""
 
+import collections
 import curses
+import queue
+import shutil
 import signal
 import string
 import textwrap
-from queue import SimpleQueue
+from functools import lru_cache
 
 KEYS = {
     # Printable comes first, so characters like 'tab' can be overridden below.
-    "printable": [ord(letter) for letter in string.printable],
+    "printable": frozenset(ord(letter) for letter in string.printable),
     "backspace": [8, 127, curses.KEY_BACKSPACE],
     "enter": [10, 13, curses.KEY_ENTER],
     "resize": [curses.KEY_RESIZE],
     "esc": [27],
     "kill": [4],  # Ctrl-D
-    "discard": [
+    "discard": frozenset({
         9,  # Tab
         90,  # Shift-Tab
         353,  # Shift-Tab
@@ -70,10 +73,16 @@ KEYS = {
         396,  # Shift-PgDn
         548,  # Alt-PgDn
         549,  # Alt-Shift-PgDn
-    ],
+    }),
 }
 
 
+@lru_cache(maxsize=4096)
+def _wrap(line, cols):
+    """Return the wrapped segments of a line, memoized by width."""
+    return tuple(textwrap.wrap(line, cols))
+
+
 class UserInterface:
     """The user interface."""
 
@@ -81,13 +90,20 @@ class UserInterface:
         """Initialize the User Interface."""
         self.active = False
         self.buffer = {
-            "input": str(),
-            "output": list(),
+            "input": list(),
+            "output": collections.deque(maxlen=10_000),
         }
-        self.keymap = dict()
-        for (key, values) in KEYS.items():
-            for value in values:
-                self.keymap[value] = key
+        self.input_version = 0
+        # Whether the last output line is an unterminated, provisional one.
+        self._partial = False
+        self._resized = False
+        self._input_last_drawn = str()
+        self._dispatch = dict()
+        for (category, codes) in KEYS.items():
+            handler = getattr(self, f"_key_{category}")
+            for code in codes:
+                self._dispatch[code] = handler
+        self._undef = self._key_undefined
         self.layout = {
             "out_frame": {
                 "parent": "base",
@@ -114,10 +130,11 @@ class UserInterface:
                 "border": False,
             },
         }
+        self.notify = None
         self.prompt = "> "
         self.queues = {
-            "input": SimpleQueue(),
-            "output": SimpleQueue(),
+            "input": queue.SimpleQueue(),
+            "output": queue.SimpleQueue(),
         }
         self.window = dict()
 
@@ -136,59 +153,64 @@ class UserInterface:
 
     def _handle_input(self):
         """Handle new input."""
-        old_buf = str(self.buffer["input"])
-        # Process new input.
+        old_version = self.input_version
+        # Process all pending input.
         key = self.window["base"].getch()
-        if key != -1:
+        while key != -1:
             self._handle_key(key)
+            key = self.window["base"].getch()
         # Redraw the window if necessary.
-        if old_buf != self.buffer["input"]:
+        if old_version != self.input_version:
             self._redraw_input()
 
     def _handle_key(self, key):
         """Handle a specific key."""
-        funcmap = {
-            "backspace": self._key_backspace,
-            "discard": self._key_discard,
-            "enter": self._key_enter,
-            "esc": self._key_esc,
-            "kill": self._key_kill,
-            "none": self._key_undefined,
-            "printable": self._key_printable,
-            "resize": self._key_resize,
-        }
-        func = funcmap.get(self.keymap.get(key, "none"), self._key_undefined)
-        func(key)
+        self._dispatch.get(key, self._undef)(key)
 
     def _handle_output(self):
         """Handle new output."""
         redraw = False
-        # Check for new output.
-        if not self.queues["output"].empty():
-            message = self.queues["output"].get()
-            if message.lower() == ";quit":
-                self.active = False
-            else:
-                self.buffer["output"].append(message)
+        # Drain all pending output.
+        try:
+            while True:
+                message = self.queues["output"].get_nowait()
+                if message == ("quit",):
+                    self.active = False
+                    break
+                (lines, partial) = message
+                if self._partial:
+                    self.buffer["output"].pop()
+                self.buffer["output"].extend(lines)
+                if partial:
+                    self.buffer["output"].append(partial)
+                self._partial = bool(partial)
                 redraw = True
+        except queue.Empty:
+            pass
         # Redraw the window if necessary.
         if redraw:
             self._redraw_output()
 
     def _key_backspace(self, key):
         """Handle the backspace key."""
-        self.buffer["input"] = self.buffer["input"][:-1]
+        if self.buffer["input"]:
+            self.buffer["input"].pop()
+            self.input_version += 1
         return key
 
     def _key_enter(self, key):
         """Handle the enter key."""
-        self.queues["input"].put(self.buffer["input"])
-        self.buffer["input"] = str()
+        self.queues["input"].put("".join(self.buffer["input"]))
+        if self.notify:
+            self.notify()
+        self.buffer["input"].clear()
+        self.input_version += 1
         return key
 
     def _key_esc(self, key):
         """Handle the escape key."""
-        self.buffer["input"] = str()
+        self.buffer["input"].clear()
+        self.input_version += 1
         return key
 
     def _key_kill(self, key):
@@ -198,11 +220,13 @@ class UserInterface:
 
     def _key_printable(self, key):
         """Add the character to the buffer."""
-        self.buffer["input"] += chr(key)
+        self.buffer["input"].append(chr(key))
+        self.input_version += 1
         return key
 
     def _key_resize(self, key):
         """Handle window resize."""
+        _wrap.cache_clear()
         try:
             self._redraw_windows()
         except curses.error:
@@ -218,7 +242,8 @@ class UserInterface:
         """Handle unknown key."""
         # While testing, we'll show the int value of the key.
         # In production, we'll simply drop the key.
-        self.buffer["input"] += f"(?{key})"
+        self.buffer["input"].extend(f"(?{key})")
+        self.input_version += 1
         return key
 
     def _launch_interface(self, stdscr):
@@ -228,6 +253,8 @@ class UserInterface:
         self.window["base"] = stdscr
         self.window["base"].nodelay(True)
         self.window["base"].timeout(25)
+        # Replaces the handler curses installs, so resize the screen below.
+        signal.signal(signal.SIGWINCH, self._on_winch)
         self._redraw_windows()
         self._main_loop()
 
@@ -236,39 +263,60 @@ class UserInterface:
         self.active = True
         while self.active:
             try:
-                if curses.is_term_resized(*self.window["base"].getmaxyx()):
-                    self._redraw_windows()
+                if self._resized:
+                    self._resized = False
+                    # Queues a KEY_RESIZE, which redraws the windows.
+                    (cols, rows) = shutil.get_terminal_size()
+                    curses.resizeterm(rows, cols)
                 curses.doupdate()
                 self._handle_input()
                 self._handle_output()
             except curses.error:
                 self.active = False
 
+    def _on_winch(self, sig, frame):
+        """Flag the terminal as resized."""
+        self._resized = True
+
     def _redraw_input(self):
         """Redraw the input window."""
         (_, max_buffer) = self.window["input"].getmaxyx()
-        value = self.buffer["input"][-1 * (max_buffer - 2) :]
-        self.window["input"].clear()
-        self.window["input"].addstr(0, 0, value)
-        self.window["input"].addstr(0, len(value), " ", curses.color_pair(1))
+        value = "".join(self.buffer["input"][-1 * (max_buffer - 2) :])
+        # Only rewrite what changed since the last draw.
+        last = self._input_last_drawn
+        prefix = 0
+        for (old, new) in zip(last, value):
+            if old != new:
+                break
+            prefix += 1
+        self.window["input"].move(0, prefix)
+        self.window["input"].clrtoeol()
+        self.window["input"].addstr(0, prefix, value[prefix:])
+        self.window["input"].chgat(0, len(value), 1, curses.color_pair(1))
+        self._input_last_drawn = value
         self.window["input"].noutrefresh()
 
     def _redraw_output(self):
         """Redraw the output window."""
         self.window["output"].clear()
         (max_rows, max_cols) = self.window["output"].getmaxyx()
-        output_lines = list()
-        for line in self.buffer["output"][::-1]:
-            output_lines += textwrap.wrap(line, max_cols)[::-1]
-            if len(output_lines) >= max_rows:
+        # Collect the visible rows, newest first, into top-down order.
+        output_lines = collections.deque(maxlen=max_rows)
+        for line in reversed(self.buffer["output"]):
+            for segment in reversed(_wrap(line, max_cols)):
+                output_lines.appendleft(segment)
+                if len(output_lines) == max_rows:
+                    break
+            if len(output_lines) == max_rows:
                 break
-        for index, line in enumerate(output_lines[:max_rows]):
-            if len(line) >= max_cols and index == 0:
+        top = max_rows - len(output_lines)
+        for row, line in enumerate(output_lines, top):
+            if len(line) >= max_cols and row == max_rows - 1:
                 self.window["output"].insch(
                     max_rows - 1, max_cols - 1, line[max_cols - 1 :][0]
                 )
                 line = line[: max_cols - 1]
-            self.window["output"].addstr(max_rows - (index + 1), 0, line)
+            self.window["output"].addstr(row, 0, line)
         self.window["output"].noutrefresh()
 
     def _redraw_windows(self):
@@ -284,6 +332,7 @@ class UserInterface:
                 if layout["border"]:
                     self.window[name].box()
             self.window["in_frame"].addstr(1, 1, self.prompt)
+            self._input_last_drawn = str()
             self._redraw_input()
             self._redraw_output()
             for _, window in self.window.items():
@@ -303,6 +352,10 @@ class UserInterface:
         """Return the input/output queues."""
         return (self.queues["input"], self.queues["output"])
 
+    def set_notify(self, func):
+        """Set the function to call after queuing input."""
+        self.notify = func
+
     def launch(self):
         """Launch the user interface."""
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -5,7 +5,6 @@ import selectors
 import signal
 import socket
 import sys
-import time
 
 class EchoServer:
     def __init__(self):
@@ -20,6 +19,14 @@ class EchoServer:
         conn.setblocking(False)
         self.sel.register(conn, selectors.EVENT_READ, self._read)
 
+    def _drain(self, sock, mask):
+        """Discard the bytes written by the signal wakeup fd."""
+        try:
+            while sock.recv(1000):
+                pass
+        except BlockingIOError:
+            pass
+
     def _halt(self, sig, frame):
         """Terminate gracefully."""
         self.active = False
@@ -37,6 +44,12 @@ class EchoServer:
     def run(self):
         signal.signal(signal.SIGINT, self._halt)
         signal.signal(signal.SIGQUIT, self._halt)
+        # PEP 475 retries select() after a signal, so have signals wake it.
+        (wake_r, wake_w) = socket.socketpair()
+        wake_r.setblocking(False)
+        wake_w.setblocking(False)
+        signal.set_wakeup_fd(wake_w.fileno())
+        self.sel.register(wake_r, selectors.EVENT_READ, self._drain)
         sock = socket.socket()
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.bind(("localhost", 1234))
@@ -45,12 +58,14 @@ class EchoServer:
         self.sel.register(sock, selectors.EVENT_READ, self._accept)
         self.active = True
         while self.active:
-            events = self.sel.select(timeout=1)
+            events = self.sel.select(timeout=None)
             for key, mask in events:
                 callback = key.data
                 callback(key.fileobj, mask)
-            time.sleep(0.1)
         sock.close()
+        signal.set_wakeup_fd(-1)
+        wake_r.close()
+        wake_w.close()
 
 
 EchoServer().run()